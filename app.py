@@ -1,36 +1,146 @@
 from __future__ import annotations
 
+import hashlib
 import json
-import re
-from dataclasses import dataclass
+import math
+import os
+import pickle
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Mapping, Optional, Protocol, Tuple, runtime_checkable
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, ItemsView, Iterable, List, Mapping, Optional, Protocol, Tuple
 
 import yaml
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import BytecodeCache, Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+try:
+    from orjson import loads as _json_loads  # optional, faster and takes bytes directly
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from yaml import CSafeLoader as _YamlLoader  # libyaml-backed, ~10x faster
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader  # type: ignore[assignment]
 
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_DIR = BASE_DIR / "config"
+CONFIG_CACHE_DIR = BASE_DIR / ".config_cache"
+TEMPLATE_CACHE_DIR = BASE_DIR / ".jinja_cache"
+STAGE_CACHE_SIZE = 4096
+PAGE_TEMPLATES = ("index.html", "form_generic.html", "result.html")
+
+
+def _template_bytecode_cache() -> Optional[BytecodeCache]:
+    # Jinja fails the render if it can't write the cache, so only enable it for a writable dir
+    try:
+        TEMPLATE_CACHE_DIR.mkdir(exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(TEMPLATE_CACHE_DIR, os.W_OK):
+        return None
+    return FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR))
+
 
 app = FastAPI(title="TNM Wizard")
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+# Templates only change on deploy (service restart): skip the per-render mtime check,
+# never evict compiled templates, and keep bytecode on disk across restarts and workers.
+# autoescape=True matches the environment Jinja2Templates would build itself.
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader(str(BASE_DIR / "templates")),
+        autoescape=True,
+        auto_reload=False,
+        cache_size=-1,
+        bytecode_cache=_template_bytecode_cache(),
+    )
+)
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 
 
 # ------------------------------
 # Config
 # ------------------------------
-@dataclass(frozen=True)
+# stage-table wildcard matching: one (kind, arg) matcher per T/N/M component
+SEG_ANY, SEG_LITERAL, SEG_PREFIX, SEG_GLOB = range(4)
+Segment = Tuple[int, str]
+WildcardRule = Tuple[Tuple[Segment, ...], str]
+# form extraction: one (name, kind) entry per input field
+FIELD_SCALAR, FIELD_NUMBER, FIELD_CHECKBOX_BOOL, FIELD_CHECKBOX_MULTI = range(4)
+FieldPlan = Tuple[Tuple[str, int], ...]
+
+
+@dataclass(frozen=True, slots=True)
 class OrganConfig:
     organ: str
     display_name: str
     version: str
     sections: List[Dict[str, Any]]
     template: str
-    stage_table: Dict[str, str]
+    stage_table: Mapping[str, str]  # frozen copy; the derived tables below are built from it
+    # derived from stage_table; compiled once instead of per request.
+    # exact keys and '*' patterns are kept apart so neither lookup scans the other
+    exact_stages: Dict[str, str] = field(init=False, repr=False, compare=False)
+    wildcard_rules: Tuple[WildcardRule, ...] = field(init=False, repr=False, compare=False)
+    wildcard_match: Callable[[str, str, str], str] = field(init=False, repr=False, compare=False)
+    # memoized (pt, pn, pm) -> stage; per config, so no id()-keyed global registry
+    stage_lookup: Callable[[str, str, str], str] = field(init=False, repr=False, compare=False)
+    # derived from sections once, so requests don't re-walk sections -> fields
+    histologic_mix_field: Optional[Dict[str, Any]] = field(init=False, repr=False, compare=False)
+    field_plan: FieldPlan = field(init=False, repr=False, compare=False)
+    # label tables for the histologic_mix field: (type_code, subtype_code) -> (type_label, subtype_label),
+    # plus type -> label for rows whose pair isn't configured
+    hist_type_labels: Dict[str, str] = field(init=False, repr=False, compare=False)
+    hist_label_pairs: Dict[Tuple[str, str], Tuple[str, str]] = field(init=False, repr=False, compare=False)
+    # (type_key, subtype_key, percent_key) per mix-table row
+    hist_keys: Tuple[Tuple[str, str, str], ...] = field(init=False, repr=False, compare=False)
+    # (label, positive_key, total_key) per lymph node station, in config order
+    nodal_stations: Tuple[Tuple[str, str, str], ...] = field(init=False, repr=False, compare=False)
+    extractor: Callable[[Mapping[str, Any]], Dict[str, Any]] = field(init=False, repr=False, compare=False)
+    # compiled report template, bound by _load_config(); None for configs built directly
+    report_template: Optional[Template] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        set_ = object.__setattr__  # frozen dataclass: derived fields are set once here
+
+        # read-only snapshot so later edits to the caller's dict can't desync the compiled lookups
+        set_(self, "stage_table", MappingProxyType(dict(self.stage_table)))
+
+        # interned so repeat lookups can short-circuit on identity before comparing characters
+        normalized = {
+            sys.intern(normalize_stage_key(k)): sys.intern(v) if isinstance(v, str) else v
+            for k, v in self.stage_table.items()
+        }
+        set_(self, "exact_stages", {k: v for k, v in normalized.items() if "*" not in k})
+
+        set_(self, "wildcard_rules", compile_wildcard_rules(normalized))
+        set_(self, "wildcard_match", build_wildcard_matcher(self.wildcard_rules))
+        set_(self, "stage_lookup", lru_cache(maxsize=STAGE_CACHE_SIZE)(partial(_derive_stage_uncached, self)))
+
+        flat = tuple(f for section in self.sections for f in section.get("fields", []))
+        mix_field = next((f for f in flat if f.get("type") == "histologic_mix"), None)
+        set_(self, "histologic_mix_field", mix_field)
+        type_labels, subtype_labels = _build_histology_label_maps(mix_field.get("types", []) if mix_field else [])
+        set_(self, "hist_type_labels", type_labels)
+        set_(self, "hist_label_pairs", _build_histology_label_pairs(type_labels, subtype_labels))
+        set_(self, "hist_keys", histology_row_keys(int(mix_field.get("rows", 4))) if mix_field else ())
+        set_(self, "nodal_stations", tuple(
+            (str(st["code"]), f"LN{st['code']}_positive", f"LN{st['code']}_total")
+            for f in flat
+            if f.get("type") == "nodal_stations"
+            for st in f.get("stations", [])
+        ))
+        set_(self, "field_plan", build_field_plan(flat))
+        set_(self, "extractor", build_extractor(self.field_plan, version=self.version))
 
     @staticmethod
     def from_dict(cfg: Dict[str, Any]) -> "OrganConfig":
@@ -51,9 +161,9 @@ class OrganConfig:
         elif isinstance(tnm, str):
             path = CONFIG_DIR / tnm
             if path.suffix == ".json":
-                stage_table = json.loads(path.read_text(encoding="utf-8"))
+                stage_table = _json_loads(path.read_bytes())
             elif path.suffix in (".yaml", ".yml"):
-                stage_table = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+                stage_table = _load_cached(path) or {}
 
         return OrganConfig(
             organ=organ,
@@ -65,41 +175,199 @@ class OrganConfig:
         )
 
 
-def load_all_configs() -> Dict[str, OrganConfig]:
-    configs: Dict[str, OrganConfig] = {}
-    for path in CONFIG_DIR.glob("*.yaml"):
-        data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
-        oc = OrganConfig.from_dict(data)
-        configs[oc.organ] = oc
-    return configs
+def _compile_segment(segment: str) -> Segment:
+    if segment == "*":
+        return (SEG_ANY, "")
+    if "*" not in segment:
+        return (SEG_LITERAL, segment)
+    if segment.endswith("*") and segment.count("*") == 1:
+        return (SEG_PREFIX, segment[:-1])
+    return (SEG_GLOB, segment)
+
+
+def compile_wildcard_rules(stage_table: Mapping[str, str]) -> Tuple[WildcardRule, ...]:
+    """
+    Split each '*' key into per-component matchers ('M1c*' -> prefix 'M1c', '*' -> any).
+    A pattern without exactly three components ('*', 'T4,*') keeps its original
+    whole-key meaning, where '*' may span commas: it becomes a single matcher
+    applied to the joined 'T,N,M' key.
+    Rules keep table order, so the first matching pattern still wins.
+    """
+    rules: List[WildcardRule] = []
+    for pattern, stage in stage_table.items():
+        if "*" not in pattern:
+            continue
+        parts = pattern.split(",")
+        if len(parts) == 3:
+            rules.append((tuple(_compile_segment(seg) for seg in parts), stage))
+        else:
+            rules.append(((_compile_segment(pattern),), stage))
+    return tuple(rules)
+
+
+def _segment_test(segment: Segment, var: str) -> str:
+    kind, arg = segment
+    if kind == SEG_LITERAL:
+        return f"{var} == {arg!r}"
+    if kind == SEG_PREFIX:
+        return f"{var}.startswith({arg!r})"
+    return f"_fnmatch({var}, {arg!r})"
+
+
+def build_wildcard_matcher(rules: Iterable[WildcardRule]) -> Callable[[str, str, str], str]:
+    """
+    Generate match(t, n, m) -> stage as a flat if-chain over the wildcard rules,
+    in table order, falling through to "Stage ?".
+    Single-matcher (whole-key) rules test the joined key k = 't,n,m'.
+    """
+    rules = tuple(rules)
+    stages: List[str] = []
+    lines = ["def _match(t, n, m):"]
+    if any(len(segments) == 1 for segments, _ in rules):
+        lines.append("    k = t + ',' + n + ',' + m")
+    for segments, stage in rules:
+        names = "tnm" if len(segments) == 3 else "k"
+        tests = [_segment_test(seg, var) for seg, var in zip(segments, names) if seg[0] != SEG_ANY]
+        lines.append(f"    if {' and '.join(tests) or 'True'}:")
+        lines.append(f"        return _stages[{len(stages)}]")
+        stages.append(stage)
+    lines.append("    return 'Stage ?'")
+
+    ns: Dict[str, Any] = {}
+    helpers = {"_fnmatch": fnmatchcase, "_stages": tuple(stages)}
+    exec(compile("\n".join(lines), "<stage-matcher>", "exec"), helpers, ns)  # patterns are repr()-quoted
+    return ns["_match"]
+
+
+def _snapshot_path(path: Path) -> Path:
+    # name + hash of the resolved path: same-named files in different dirs get separate snapshots
+    digest = hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:16]
+    return CONFIG_CACHE_DIR / f"{path.name}.{digest}.pkl"
+
+
+def _load_cached(path: Path) -> Any:
+    """
+    Parse a YAML file, reusing a pickled snapshot while the source is unchanged.
+    The snapshot is keyed by (path, mtime_ns, size); any cache problem falls back to parsing.
+    """
+    st = path.stat()
+    key = (str(path.resolve()), st.st_mtime_ns, st.st_size)
+    cache_path = _snapshot_path(path)
+
+    try:
+        cached_key, data = pickle.loads(cache_path.read_bytes())
+        if cached_key == key:
+            return data
+    except Exception:  # missing, stale-format or corrupt snapshot -> re-parse
+        pass
+
+    data = yaml.load(path.read_text(encoding="utf-8"), Loader=_YamlLoader)
 
+    try:
+        CONFIG_CACHE_DIR.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CONFIG_CACHE_DIR, suffix=".tmp")
+    except OSError:
+        return data  # read-only deploy dir: just skip caching
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except Exception:  # caching is best-effort; don't leave the partial snapshot behind
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
 
-FORM_CONFIGS: Dict[str, OrganConfig] = load_all_configs()
+    return data
+
+
+def _load_config(path: Path) -> OrganConfig:
+    data = _load_cached(path) or {}
+    oc = OrganConfig.from_dict(data)
+    object.__setattr__(oc, "report_template", templates.get_template(oc.template))
+    return oc
+
+
+def _load_configs(paths: List[Path]) -> List[OrganConfig]:
+    # read + parse files concurrently; results keep the order of paths
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+        return list(ex.map(_load_config, paths))
+
+
+class LazyConfigs:
+    """
+    organ -> OrganConfig, parsed on first use instead of at import.
+    get() reads only config/{organ}.yaml; anything that needs every organ
+    (items(), or a miss on the file-name lookup) loads the remaining files once.
+    Iteration follows sorted file order (stable organ order), whatever was requested first.
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[str, OrganConfig] = {}
+        self._by_path: Dict[Path, OrganConfig] = {}
+        self._all_loaded = False
+
+    def _load_all(self) -> None:
+        if self._all_loaded:
+            return
+        paths = sorted(CONFIG_DIR.glob("*.yaml"))
+        # files already parsed by get() are reused, not re-read
+        missing = [p for p in paths if p not in self._by_path]
+        self._by_path.update(zip(missing, _load_configs(missing)))
+        self._cache = {oc.organ: oc for oc in (self._by_path[p] for p in paths)}
+        self._all_loaded = True
+
+    def get(self, organ: str) -> Optional[OrganConfig]:
+        cfg = self._cache.get(organ)
+        if cfg is not None or self._all_loaded:
+            return cfg
+
+        path = CONFIG_DIR / f"{organ}.yaml"
+        if path.name == f"{organ}.yaml" and path.is_file():
+            oc = _load_config(path)
+            self._by_path[path] = oc
+            self._cache[oc.organ] = oc
+            if oc.organ == organ:
+                return oc
+
+        # file name doesn't match the organ key (or unknown organ): scan everything once
+        self._load_all()
+        return self._cache.get(organ)
+
+    def __getitem__(self, organ: str) -> OrganConfig:
+        cfg = self.get(organ)
+        if cfg is None:
+            raise KeyError(organ)
+        return cfg
+
+    def __contains__(self, organ: object) -> bool:
+        return isinstance(organ, str) and self.get(organ) is not None
+
+    def items(self) -> ItemsView[str, OrganConfig]:
+        self._load_all()
+        return self._cache.items()
 
 
 # ------------------------------
 # Small helpers (keep functions simple for Sonar)
 # ------------------------------
-def iter_config_fields(cfg: OrganConfig) -> Iterable[Dict[str, Any]]:
-    for section in cfg.sections:
-        for field in section.get("fields", []):
-            yield field
-
-
-def has_field_type(cfg: OrganConfig, field_type: str) -> bool:
-    return any(
-        field.get("type") == field_type
-        for section in cfg.sections
-        for field in section.get("fields", [])
-    )
+_TRUTHY: FrozenSet[str] = frozenset({"true", "on", "1", "yes"})
 
 
 def to_bool(value: Any) -> bool:
-    return str(value or "").strip().lower() in {"true", "on", "1", "yes"}
+    # form values are already str: skip the str() round-trip for them
+    if type(value) is not str:
+        value = str(value or "")
+    return value.strip().lower() in _TRUTHY
 
 
 def to_float_or_none(value: Any) -> Optional[float]:
-    if value in (None, "", []):
+    if isinstance(value, list):  # repeated form key: use the first value
+        value = value[0] if value else None
+    if value is None or value == "":
         return None
     try:
         return float(value)
@@ -107,33 +375,76 @@ def to_float_or_none(value: Any) -> Optional[float]:
         return None
 
 
-@runtime_checkable
 class SupportsGetList(Protocol):
-
+    # typing only: callers check type(form).getlist directly, which is much
+    # cheaper than a runtime_checkable isinstance() on every field
     def getlist(self, key: str) -> List[Any]:
         ...
 
 
 def getlist(form_like: Mapping[str, Any] | SupportsGetList, name: str) -> List[str]:
-    if isinstance(form_like, SupportsGetList):
-        return [str(v) for v in form_like.getlist(name) if v not in (None, "")]
+    getlist_ = getattr(type(form_like), "getlist", None)
+    if getlist_ is not None:
+        vals = getlist_(form_like, name)
+    else:
+        value = form_like.get(name)
+        if value is None:
+            return []
+        if isinstance(value, str):
+            if "," in value:
+                return [s for s in (v.strip() for v in value.split(",")) if s]
+            return [value]
+        if not isinstance(value, list):
+            return [str(value)]
+        vals = value
+
+    # one filtering pass; form values are almost always str already
+    return [v if type(v) is str else str(v) for v in vals if v is not None and v != ""]
+
+
+class IndexedForm:
+    """
+    Multi-valued form grouped by key in a single pass over its items.
+    Starlette's FormData.getlist() scans every posted item per call; the nodal
+    summary alone makes two calls per station, so index once per request.
+    get() returns the last value for a key, like FormData.get().
+    """
 
-    value = form_like.get(name)
-    if value is None:
-        return []
-    if isinstance(value, list):
-        return [str(v) for v in value if v not in (None, "")]
-    if isinstance(value, str) and "," in value:
-        return [v.strip() for v in value.split(",") if v.strip()]
-    return [str(value)]
+    __slots__ = ("_lists",)
+
+    def __init__(self, items: Iterable[Tuple[str, Any]]) -> None:
+        lists: Dict[str, List[Any]] = {}
+        for key, value in items:
+            vals = lists.get(key)
+            if vals is None:
+                lists[key] = [value]
+            else:
+                vals.append(value)
+        self._lists = lists
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        vals = self._lists.get(key)
+        return vals[-1] if vals else default
+
+    def getlist(self, key: str) -> List[Any]:
+        return list(self._lists.get(key, ()))
 
 
 # ------------------------------
 # TNM stage
 # ------------------------------
 def normalize_tnm_component(value: str) -> str:
-    s = (value or "").strip()
-    return s[1:] if s.startswith("p") else s
+    # drop one descriptor prefix (pT1a, cN0, yM0, rT2): only when a T/N/M category follows
+    s = value.strip() if value else ""
+    return s[1:] if len(s) > 1 and s[0] in "pcyr" and s[1] in "TNM" else s
+
+
+def normalize_stage_key(key: str) -> str:
+    """Normalize each comma-separated component of a stage-table key ('pT1a,pN0,M0' -> 'T1a,N0,M0')."""
+    return ",".join(normalize_tnm_component(part) for part in key.split(","))
 
 
 def derive_stage(cfg: OrganConfig, pt: str, pn: str, pm: str) -> str:
@@ -141,90 +452,95 @@ def derive_stage(cfg: OrganConfig, pt: str, pn: str, pm: str) -> str:
     TNM -> stage lookup with simple wildcard support.
     - Exact match has priority (e.g. 'T1a,N0,M0')
     - If no exact match, try patterns with '*' such as 'T*,N*,M1*'
+    Lookups are pure, so results are memoized per config (cfg.stage_lookup).
     """
-    key = ",".join(
-        [
-            normalize_tnm_component(pt),
-            normalize_tnm_component(pn),
-            normalize_tnm_component(pm),
-        ]
-    )
+    return cfg.stage_lookup(pt, pn, pm)
+
 
-    table = cfg.stage_table
+def _derive_stage_uncached(cfg: OrganConfig, pt: str, pn: str, pm: str) -> str:
+    # only reached on a stage_lookup cache miss
+    parts = (normalize_tnm_component(pt), normalize_tnm_component(pn), normalize_tnm_component(pm))
 
-    # 1) exact
-    exact = table.get(key)
+    # 1) exact (table keys normalized at load time)
+    exact = cfg.exact_stages.get(",".join(parts))
     if exact:
         return exact
 
-    # 2) wildcard
-    for pattern, stage in table.items():
-        if "*" not in pattern:
-            continue
-        regex_pattern = "^" + re.escape(pattern).replace("\\*", ".*") + "$"
-        if re.match(regex_pattern, key):
-            return stage
-
-    return "Stage ?"
+    # 2) wildcard: generated ==/startswith chain, no regex engine
+    return cfg.wildcard_match(*parts)
 
 
 # ------------------------------
 # Form extraction
 # ------------------------------
-def read_field_value(form: Mapping[str, Any], field: Dict[str, Any]) -> Any:
-    name = field["name"]
-    ftype = field.get("type")
-    options = field.get("options")
-
+def _field_kind(f: Dict[str, Any]) -> int:
+    ftype = f.get("type")
+    if ftype == "number":
+        return FIELD_NUMBER
     if ftype == "checkbox":
-        # multi-choice checkbox group
-        if options:
-            return getlist(form, name)
-        # single boolean checkbox
-        return to_bool(form.get(name))
+        # multi-choice checkbox group vs single boolean checkbox
+        return FIELD_CHECKBOX_MULTI if f.get("options") else FIELD_CHECKBOX_BOOL
+    return FIELD_SCALAR
 
-    return form.get(name)
 
+def build_field_plan(fields: Iterable[Dict[str, Any]]) -> FieldPlan:
+    """Reduce field definitions to (name, kind) pairs, classified once at load."""
+    return tuple((f["name"], _field_kind(f)) for f in fields)
 
-def extract_fields(form: Mapping[str, Any], cfg: OrganConfig) -> Dict[str, Any]:
-    data: Dict[str, Any] = {}
 
-    for field in iter_config_fields(cfg):
-        name = field["name"]
-        ftype = field.get("type")
+# per-kind value expression; {key} is the repr()-quoted field name
+_FIELD_EXPRS = {
+    FIELD_SCALAR: "get({key})",
+    FIELD_NUMBER: "_to_float(get({key}))",
+    FIELD_CHECKBOX_BOOL: "_to_bool(get({key}))",
+    FIELD_CHECKBOX_MULTI: "_getlist(form, {key})",
+}
+
 
-        value = read_field_value(form, field)
+def build_extractor(
+    plan: FieldPlan, *, version: str = ""
+) -> Callable[[Mapping[str, Any]], Dict[str, Any]]:
+    """
+    Generate a form extractor specialized to a config's field plan.
+    Field kinds are static, so the per-field type dispatch is done once here
+    and the generated function only reads known names with known coercions.
+    A non-empty config version is emitted as a literal "version" entry.
+    """
+    items = [f"        {name!r}: {_FIELD_EXPRS[kind].format(key=repr(name))}," for name, kind in plan]
+    if version:
+        items.append(f"        'version': {version!r},")
+    src = "\n".join(["def _extract(form):", "    get = form.get", "    return {", *items, "    }"])
 
-        if ftype == "number":
-            value = to_float_or_none(value)
+    ns: Dict[str, Any] = {}
+    helpers = {"_to_float": to_float_or_none, "_to_bool": to_bool, "_getlist": getlist}
+    exec(compile(src, "<extractor>", "exec"), helpers, ns)  # field names are repr()-quoted
+    return ns["_extract"]
 
-        data[name] = value
 
-    return data
+def extract_fields(form: Mapping[str, Any], cfg: OrganConfig) -> Dict[str, Any]:
+    return cfg.extractor(form)
 
 
 # ------------------------------
 # Histology summary (mix table)
 # ------------------------------
-def find_histologic_mix_field(cfg: OrganConfig) -> Optional[Dict[str, Any]]:
-    for field in iter_config_fields(cfg):
-        if field.get("type") == "histologic_mix":
-            return field
-    return None
-
-
 def parse_pct(value: Any) -> float:
+    if value is None or value == "":
+        return 0.0
+    # float() already ignores surrounding whitespace
     try:
-        s = str(value or "").strip()
-        return float(s) if s else 0.0
-    except ValueError:
+        pct = float(value)
+    except (TypeError, ValueError):
         return 0.0
+    # "inf"/"nan"/"1e400" parse fine but can't be rounded to a whole percent
+    return pct if math.isfinite(pct) else 0.0
 
 
 # ------------------------------
 # Histology summary (mix table) - refactor for Sonar complexity
 # ------------------------------
-HistRow = Dict[str, Any]
+# (type_code, subtype_code, pct) of one non-empty mix-table row
+HistRow = Tuple[str, str, float]
 
 
 def _build_histology_label_maps(types_cfg: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, Dict[str, str]]]:
@@ -248,45 +564,69 @@ def _build_histology_label_maps(types_cfg: List[Dict[str, Any]]) -> Tuple[Dict[s
     return type_labels, subtype_labels
 
 
-def _collect_histology_rows(form_data: Mapping[str, Any], max_rows: int) -> List[HistRow]:
+def histology_row_keys(max_rows: int) -> Tuple[Tuple[str, str, str], ...]:
+    return tuple(
+        (f"histologic_type_{i}", f"histologic_subtype_{i}", f"histologic_percent_{i}")
+        for i in range(1, max_rows + 1)
+    )
+
+
+def _build_histology_label_pairs(
+    type_labels: Dict[str, str], subtype_labels: Dict[str, Dict[str, str]]
+) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    pairs: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    for t_code, t_label in type_labels.items():
+        pairs[(t_code, "")] = (t_label, "")
+        for s_code, s_label in subtype_labels.get(t_code, {}).items():
+            pairs[(t_code, s_code)] = (t_label, s_label)
+    return pairs
+
+
+def _collect_histology_rows(
+    form_data: Mapping[str, Any], hist_keys: Iterable[Tuple[str, str, str]]
+) -> Tuple[List[HistRow], int]:
+    """
+    Collect non-empty rows and pick the primary one in the same pass.
+    Primary = highest pct, ties broken by having a subtype; the first such row wins.
+    Returns (rows, index of primary row); index is -1 when there are no rows.
+    """
     rows: List[HistRow] = []
+    best_idx = -1
+    best_score = (0.0, 0)
 
-    for i in range(1, max_rows + 1):
-        t_code = (form_data.get(f"histologic_type_{i}") or "").strip()
-        s_code = (form_data.get(f"histologic_subtype_{i}") or "").strip()
+    for type_key, subtype_key, pct_key in hist_keys:
+        t_code = (form_data.get(type_key) or "").strip()
+        s_code = (form_data.get(subtype_key) or "").strip()
 
-        pct_raw = form_data.get(f"histologic_percent_{i}")
+        pct_raw = form_data.get(pct_key)
         pct_str = str(pct_raw or "").strip()
 
-        # skip fully empty rows
+        # skip fully empty rows (browsers post every row, blank or not)
         if not (t_code or s_code or pct_str):
             continue
 
-        rows.append(
-            {
-                "type_code": t_code,
-                "subtype_code": s_code,
-                "pct": parse_pct(pct_raw),
-            }
-        )
-
-    return rows
+        pct = parse_pct(pct_raw)
+        score = (pct, 1 if s_code else 0)
+        if best_idx < 0 or score > best_score:
+            best_idx, best_score = len(rows), score
 
+        rows.append((t_code, s_code, pct))
 
-def _pick_primary_row(rows: List[HistRow]) -> HistRow:
-    def score(r: HistRow) -> tuple[float, int]:
-        pct = float(r.get("pct") or 0.0)
-        has_subtype = 1 if (r.get("subtype_code") or "").strip() else 0
-        return (pct, has_subtype)
-    return max(rows, key=score)
+    return rows, best_idx
 
 
 def _label_for_type(type_labels: Dict[str, str], type_code: str) -> str:
     return type_labels.get(type_code, type_code or "")
 
 
-def _label_for_subtype(subtype_labels: Dict[str, Dict[str, str]], type_code: str, subtype_code: str) -> str:
-    return subtype_labels.get(type_code, {}).get(subtype_code, subtype_code or "")
+def _row_labels(
+    label_pairs: Dict[Tuple[str, str], Tuple[str, str]], type_labels: Dict[str, str], t_code: str, s_code: str
+) -> Tuple[str, str]:
+    # one flat lookup; unknown subtype (or type) falls back to the raw code
+    pair = label_pairs.get((t_code, s_code))
+    if pair is None:
+        pair = (_label_for_type(type_labels, t_code), s_code)
+    return pair
 
 
 def _format_primary_parts(pt_label: str, ps_label: str, ppct: float, *, is_ad: bool = True) -> List[str]:
@@ -301,17 +641,21 @@ def _format_primary_parts(pt_label: str, ps_label: str, ppct: float, *, is_ad: b
         parts.append(ps_label or pt_label)
         return parts
 
+    # whole percent; round() matches f"{pct:.0f}" (half-to-even) without float formatting.
+    # Only shown when > 0
+    pct_txt = "(" + str(round(ppct)) + "%)" if ppct > 0 else ""
+
     if pt_label and ps_label and ps_label.startswith(pt_label):
-        parts.append(ps_label if ppct <= 0 else f"{ps_label} ({ppct:.0f}%)")
+        parts.append(ps_label if ppct <= 0 else f"{ps_label} {pct_txt}")
         return parts
 
     if pt_label:
         parts.append(pt_label)
 
     if ps_label:
-        parts.append(ps_label if ppct <= 0 else f"{ps_label} ({ppct:.0f}%)")
+        parts.append(ps_label if ppct <= 0 else f"{ps_label} {pct_txt}")
     elif ppct > 0:
-        parts.append(f"({ppct:.0f}%)")
+        parts.append(pct_txt)
 
     return parts
 
@@ -319,22 +663,18 @@ def _format_primary_parts(pt_label: str, ps_label: str, ppct: float, *, is_ad: b
 def _format_non_primary_part(
     r: HistRow,
     pt_code: str,
+    label_pairs: Dict[Tuple[str, str], Tuple[str, str]],
     type_labels: Dict[str, str],
-    subtype_labels: Dict[str, Dict[str, str]],
     *,
     is_ad: bool = True,
 ) -> str:
-    pct = float(r.get("pct") or 0.0)
+    t_code, s_code, pct = r  # codes already stripped by _collect_histology_rows
     if pct <= 0:
         return ""
 
-    t_code = (r.get("type_code") or "").strip()
-    s_code = (r.get("subtype_code") or "").strip()
+    t_label, s_label = _row_labels(label_pairs, type_labels, t_code, s_code)
 
-    t_label = _label_for_type(type_labels, t_code)
-    s_label = _label_for_subtype(subtype_labels, t_code, s_code)
-
-    pct_txt = f"({pct:.0f}%)"
+    pct_txt = "(" + str(round(pct)) + "%)"
 
     # Non-AD secondary row: subtype label only (with pct), no type prefix
     if not is_ad:
@@ -342,7 +682,7 @@ def _format_non_primary_part(
         return f"{label} {pct_txt}".strip() if label else pct_txt
 
     # if same primary type, prefer subtype label; otherwise fall back to type label
-    if t_code == (pt_code or "").strip():
+    if t_code == pt_code:
         label = s_label or t_label
         return f"{label} {pct_txt}".strip() if label else pct_txt
 
@@ -357,33 +697,26 @@ def _format_non_primary_part(
 
 
 def build_histologic_summary(form_data: Mapping[str, Any], cfg: OrganConfig) -> str:
-    mix_field = find_histologic_mix_field(cfg)
-    if not mix_field:
+    if not form_data or cfg.histologic_mix_field is None:
         return ""
 
-    max_rows = int(mix_field.get("rows", 4))
-    types_cfg = mix_field.get("types", [])
-
-    type_labels, subtype_labels = _build_histology_label_maps(types_cfg)
-    rows = _collect_histology_rows(form_data, max_rows)
+    rows, primary_idx = _collect_histology_rows(form_data, cfg.hist_keys)
     if not rows:
         return ""
 
-    primary = _pick_primary_row(rows)
-    pt_code = primary.get("type_code", "")
-    ps_code = primary.get("subtype_code", "")
-    ppct = float(primary.get("pct") or 0.0)
+    label_pairs = cfg.hist_label_pairs
+    type_labels = cfg.hist_type_labels
 
-    pt_label = _label_for_type(type_labels, pt_code)
-    ps_label = _label_for_subtype(subtype_labels, pt_code, ps_code)
+    pt_code, ps_code, ppct = rows[primary_idx]
+    pt_label, ps_label = _row_labels(label_pairs, type_labels, pt_code, ps_code)
 
     is_ad = pt_code == "AD"
     parts = _format_primary_parts(pt_label, ps_label, ppct, is_ad=is_ad)
 
-    for r in rows:
-        if r is primary:
+    for i, r in enumerate(rows):
+        if i == primary_idx:
             continue
-        frag = _format_non_primary_part(r, pt_code, type_labels, subtype_labels, is_ad=is_ad)
+        frag = _format_non_primary_part(r, pt_code, label_pairs, type_labels, is_ad=is_ad)
         if frag:
             parts.append(frag)
 
@@ -394,8 +727,9 @@ def build_histologic_summary(form_data: Mapping[str, Any], cfg: OrganConfig) ->
 # Nodal summary
 # ------------------------------
 def _first_nonempty(form_like: Mapping[str, Any] | SupportsGetList, key: str) -> str:
-    if isinstance(form_like, SupportsGetList):
-        for v in form_like.getlist(key):
+    getlist_ = getattr(type(form_like), "getlist", None)
+    if getlist_ is not None:
+        for v in getlist_(form_like, key):
             s = str(v or "").strip()
             if s:
                 return s
@@ -403,26 +737,19 @@ def _first_nonempty(form_like: Mapping[str, Any] | SupportsGetList, key: str) ->
     return str(form_like.get(key) or "").strip()
 
 
-def build_nodal_summary(form_data: Mapping[str, Any] | SupportsGetList) -> str:
-    pos_suffix = "_positive"
-    total_suffix = "_total"
-    parts: List[str] = []
+def build_nodal_summary(form_data: Mapping[str, Any] | SupportsGetList, cfg: OrganConfig) -> str:
+    if not form_data or not cfg.nodal_stations:
+        return ""
 
-    # FormData iteration can include duplicates; use set for stability
-    keys = sorted(set(form_data))
-    for key in keys:
-        if not key.endswith(pos_suffix):
-            continue
+    parts: List[str] = []
 
-        pos_val = _first_nonempty(form_data, key)
+    # station keys are fixed by the config; no need to scan/sort the whole form
+    for label, pos_key, total_key in cfg.nodal_stations:
+        pos_val = _first_nonempty(form_data, pos_key)
         if not pos_val:
             continue
 
-        base = key[: -len(pos_suffix)]
-        total_key = f"{base}{total_suffix}"
         total_val = _first_nonempty(form_data, total_key)
-
-        label = base[2:] if base.startswith("LN") else base
         parts.append(f"{label} ({pos_val}/{total_val})" if total_val else f"{label} ({pos_val}/?)")
 
     return ", ".join(parts)
@@ -431,6 +758,18 @@ def build_nodal_summary(form_data: Mapping[str, Any] | SupportsGetList) -> str:
 # ------------------------------
 # Routes
 # ------------------------------
+FORM_CONFIGS = LazyConfigs()
+
+# warm the page templates (report templates are bound as each config loads)
+for _name in PAGE_TEMPLATES:
+    templates.get_template(_name)
+
+
+def _report_template(cfg: OrganConfig) -> Template:
+    # configs from from_dict()/the constructor aren't bound; the env caches the compiled template
+    return cfg.report_template or templates.get_template(cfg.template)
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     organs = [{"code": k, "label": cfg.display_name} for k, cfg in FORM_CONFIGS.items()]
@@ -451,29 +790,18 @@ async def generate_report(request: Request, organ: str):
     if cfg is None:
         return HTMLResponse("Unknown organ", status_code=404)
 
-    form = await request.form()
-
-    data = extract_fields(form, cfg)
-    if cfg.version:
-        data["version"] = cfg.version
+    form = IndexedForm((await request.form()).multi_items())
 
+    data = extract_fields(form, cfg)  # includes cfg.version when set
     data["histologic_summary"] = build_histologic_summary(form, cfg)
-
-    if has_field_type(cfg, "nodal_stations"):
-        data["nodal_summary"] = build_nodal_summary(form)
-    else:
-        data["nodal_summary"] = ""
+    data["nodal_summary"] = build_nodal_summary(form, cfg)  # "" when the config has no stations
 
     # TNM stage (expects extracted keys pT/pN/pM)
-    pt = data.get("pT")
-    pn = data.get("pN")
-    pm = data.get("pM")
+    pt, pn, pm = data.get("pT"), data.get("pN"), data.get("pM")
     if pt and pn and pm:
         data["stage"] = derive_stage(cfg, pt, pn, pm)
 
-    # FIX: use cfg.template (your YAML key is "template")
-    report_template = templates.get_template(cfg.template)
-    report_text = report_template.render(data=data)
+    report_text = _report_template(cfg).render(data=data)
 
     return templates.TemplateResponse(
         "result.html",
@@ -1,16 +1,22 @@
 """Tests for critical backend logic in app.py."""
 from __future__ import annotations
 
+import os
+
 import pytest
 
+import app as app_module
 from app import (
+    IndexedForm,
     OrganConfig,
-    _pick_primary_row,
+    _load_cached,
+    _collect_histology_rows,
     build_histologic_summary,
     build_nodal_summary,
     derive_stage,
     extract_fields,
     getlist,
+    histology_row_keys,
     normalize_tnm_component,
     parse_pct,
     to_bool,
@@ -20,8 +26,9 @@ from app import (
 
 # ---------------------------------------------------------------------------
 # Fixtures – minimal OrganConfig objects
+# (read-only, so built once per session; derive_stage's memo is the only state)
 # ---------------------------------------------------------------------------
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def lung_cfg() -> OrganConfig:
     """Real lung config loaded from YAML (integration-style)."""
     from app import FORM_CONFIGS
@@ -29,7 +36,7 @@ def lung_cfg() -> OrganConfig:
     return FORM_CONFIGS["lung"]
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def mini_cfg() -> OrganConfig:
     """Tiny config with a histologic_mix field for unit tests."""
     return OrganConfig(
@@ -61,7 +68,7 @@ def mini_cfg() -> OrganConfig:
     )
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def mix_cfg() -> OrganConfig:
     """Config with a histologic_mix field for histology summary tests."""
     return OrganConfig(
@@ -103,7 +110,7 @@ def mix_cfg() -> OrganConfig:
     )
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def no_mix_cfg() -> OrganConfig:
     """Config WITHOUT a histologic_mix field."""
     return OrganConfig(
@@ -116,16 +123,50 @@ def no_mix_cfg() -> OrganConfig:
     )
 
 
+@pytest.fixture(scope="session")
+def nodal_cfg() -> OrganConfig:
+    """Config with a nodal_stations field for nodal summary tests."""
+    return OrganConfig(
+        organ="nodal_test",
+        display_name="Nodal Test",
+        version="v1",
+        sections=[
+            {
+                "id": "ln",
+                "fields": [
+                    {
+                        "name": "nodal_stations",
+                        "type": "nodal_stations",
+                        "stations": [{"code": "1R", "label": "1R"}, {"code": "7", "label": "7"}],
+                    },
+                ],
+            }
+        ],
+        template="dummy.j2",
+        stage_table={},
+    )
+
+
 # ===================================================================
 # 1. derive_stage()
 # ===================================================================
 class TestDeriveStage:
+    @staticmethod
+    def _stage_cfg(stage_table):
+        return OrganConfig(
+            organ="t", display_name="t", version="", sections=[], template="dummy.j2", stage_table=stage_table,
+        )
+
     def test_exact_match(self, mini_cfg: OrganConfig):
         assert derive_stage(mini_cfg, "T1a", "N0", "M0") == "Stage IA1"
 
     def test_exact_match_t1b(self, mini_cfg: OrganConfig):
         assert derive_stage(mini_cfg, "T1b", "N0", "M0") == "Stage IA2"
 
+    def test_exact_table_excludes_patterns(self, mini_cfg: OrganConfig):
+        assert mini_cfg.exact_stages
+        assert not any("*" in key for key in mini_cfg.exact_stages)
+
     def test_wildcard_m1a(self, mini_cfg: OrganConfig):
         assert derive_stage(mini_cfg, "T2a", "N0", "M1a") == "Stage IVA"
 
@@ -138,6 +179,62 @@ class TestDeriveStage:
     def test_no_match(self, mini_cfg: OrganConfig):
         assert derive_stage(mini_cfg, "TX", "NX", "M0") == "Stage ?"
 
+    def test_wildcard_table_order_wins(self):
+        cfg = self._stage_cfg({"T*,N*,M1*": "first", "T*,N*,M1a": "second"})
+        assert derive_stage(cfg, "T1a", "N0", "M1a") == "first"
+
+    def test_p_prefixed_table_keys(self):
+        cfg = self._stage_cfg({"pT1a,pN0,pM0": "Stage IA1", "pT*,pN*,pM1a": "Stage IVA"})
+        assert derive_stage(cfg, "T1a", "N0", "M0") == "Stage IA1"
+        assert derive_stage(cfg, "pT2", "pN1", "pM1a") == "Stage IVA"
+
+    def test_repeat_lookup_is_memoized(self, mini_cfg: OrganConfig):
+        assert derive_stage(mini_cfg, "T1a", "N0", "M1c1") == "Stage IVB"
+        hits = mini_cfg.stage_lookup.cache_info().hits
+        assert derive_stage(mini_cfg, "T1a", "N0", "M1c1") == "Stage IVB"
+        assert mini_cfg.stage_lookup.cache_info().hits == hits + 1
+
+    def test_wildcard_inside_component(self):
+        cfg = self._stage_cfg({"T*,N*,M*c2": "Stage IVB"})
+        assert derive_stage(cfg, "T1a", "N0", "M1c2") == "Stage IVB"
+        assert derive_stage(cfg, "T1a", "N0", "M1c1") == "Stage ?"
+
+    def test_wildcard_quoted_component(self):
+        cfg = self._stage_cfg({"*,N0,M'0": "quoted"})
+        assert derive_stage(cfg, "T1", "N0", "M'0") == "quoted"
+
+    @pytest.mark.parametrize(
+        "pattern, tnm, matches",
+        [
+            ("*", ("T1", "N1", "M0"), True),
+            ("T4,*", ("T4", "N2", "M1a"), True),
+            ("T4,*", ("T3", "N2", "M1a"), False),
+            ("T*,N*", ("T1", "N0", "M0"), True),  # '*' spans commas in whole-key patterns
+            ("*,M1c", ("T2", "N0", "M1c"), True),
+            ("T*,N*,M*,X", ("T1", "N0", "M0"), False),
+        ],
+    )
+    def test_wildcard_other_component_counts_match_whole_key(self, pattern, tnm, matches):
+        cfg = self._stage_cfg({pattern: "hit"})
+        assert derive_stage(cfg, *tnm) == ("hit" if matches else "Stage ?")
+
+    def test_catch_all_keeps_table_order(self):
+        cfg = self._stage_cfg({"T*,N*,M1*": "Stage IV", "*": "fallback"})
+        assert derive_stage(cfg, "T1", "N0", "M1a") == "Stage IV"
+        assert derive_stage(cfg, "T1", "N0", "M0") == "fallback"
+
+    def test_stage_table_is_frozen_copy(self):
+        table = {"T1a,N0,M0": "Stage IA1"}
+        cfg = self._stage_cfg(table)
+        table["T1a,N0,M0"] = "changed"
+        assert cfg.stage_table["T1a,N0,M0"] == "Stage IA1"
+        with pytest.raises(TypeError):
+            cfg.stage_table["T1b,N0,M0"] = "x"
+
+    def test_no_wildcards(self):
+        cfg = self._stage_cfg({"T1a,N0,M0": "Stage IA1"})
+        assert derive_stage(cfg, "T1a", "N0", "M1a") == "Stage ?"
+
     # Integration-style with real lung config
     def test_lung_stage_0(self, lung_cfg: OrganConfig):
         assert derive_stage(lung_cfg, "Tis", "N0", "M0") == "Stage 0"
@@ -218,6 +315,59 @@ class TestBuildHistologicSummary:
     def test_empty_form(self, mix_cfg: OrganConfig):
         assert build_histologic_summary({}, mix_cfg) == ""
 
+    @pytest.mark.parametrize(
+        "primary, secondary, expected",
+        [("87.5", "12.5", "lepidic (88%), solid (12%)"), ("62.5", "37.5", "lepidic (62%), solid (38%)")],
+    )
+    def test_pct_rounds_like_format(self, mix_cfg: OrganConfig, primary, secondary, expected):
+        # same text as f"{pct:.0f}" (half-to-even), so the report reads as before
+        form = {
+            "histologic_type_1": "AD",
+            "histologic_subtype_1": "AD_lepidic",
+            "histologic_percent_1": primary,
+            "histologic_type_2": "AD",
+            "histologic_subtype_2": "AD_solid",
+            "histologic_percent_2": secondary,
+        }
+        result = build_histologic_summary(form, mix_cfg)
+        assert result == "Invasive non-mucinous adenocarcinoma, " + expected
+
+    @pytest.mark.parametrize("pct", ["inf", "-inf", "nan", "1e400"])
+    def test_non_finite_pct_is_not_shown(self, mix_cfg: OrganConfig, pct):
+        form = {
+            "histologic_type_1": "AD",
+            "histologic_subtype_1": "AD_lepidic",
+            "histologic_percent_1": pct,
+            "histologic_type_2": "AD",
+            "histologic_subtype_2": "AD_solid",
+            "histologic_percent_2": pct,
+        }
+        result = build_histologic_summary(form, mix_cfg)
+        assert result == "Invasive non-mucinous adenocarcinoma, lepidic"
+
+    def test_unknown_secondary_subtype_falls_back_to_code(self, mix_cfg: OrganConfig):
+        form = {
+            "histologic_type_1": "AD",
+            "histologic_subtype_1": "AD_lepidic",
+            "histologic_percent_1": "70",
+            "histologic_type_2": "SQ",
+            "histologic_subtype_2": "SQ_unknown",
+            "histologic_percent_2": "30",
+        }
+        result = build_histologic_summary(form, mix_cfg)
+        assert result.endswith("Squamous cell carcinoma: SQ_unknown (30%)")
+
+    def test_rows_beyond_configured_max_ignored(self, mix_cfg: OrganConfig):
+        form = {
+            "histologic_type_1": "SQ",
+            "histologic_subtype_1": "SQ_keratin",
+            "histologic_percent_1": "40",
+            "histologic_type_5": "AD",
+            "histologic_subtype_5": "AD_solid",
+            "histologic_percent_5": "60",
+        }
+        assert build_histologic_summary(form, mix_cfg) == "Squamous cell carcinoma, keratinizing type"
+
     def test_no_mix_field(self, no_mix_cfg: OrganConfig):
         form = {"histologic_type_1": "AD", "histologic_percent_1": "100"}
         assert build_histologic_summary(form, no_mix_cfg) == ""
@@ -227,31 +377,42 @@ class TestBuildHistologicSummary:
 # 3. build_nodal_summary()
 # ===================================================================
 class TestBuildNodalSummary:
-    def test_single_station(self):
+    def test_single_station(self, nodal_cfg: OrganConfig):
         form = {"LN1R_positive": "2", "LN1R_total": "5"}
-        assert build_nodal_summary(form) == "1R (2/5)"
+        assert build_nodal_summary(form, nodal_cfg) == "1R (2/5)"
 
-    def test_multiple_stations(self):
+    def test_multiple_stations(self, nodal_cfg: OrganConfig):
         form = {
             "LN1R_positive": "2",
             "LN1R_total": "5",
             "LN7_positive": "1",
             "LN7_total": "3",
         }
-        result = build_nodal_summary(form)
+        result = build_nodal_summary(form, nodal_cfg)
         assert "1R (2/5)" in result
         assert "7 (1/3)" in result
 
-    def test_missing_total(self):
+    def test_config_order(self, nodal_cfg: OrganConfig):
+        form = {"LN7_positive": "1", "LN1R_positive": "2"}
+        assert build_nodal_summary(form, nodal_cfg) == "1R (2/?), 7 (1/?)"
+
+    def test_missing_total(self, nodal_cfg: OrganConfig):
         form = {"LN1R_positive": "2"}
-        assert build_nodal_summary(form) == "1R (2/?)"
+        assert build_nodal_summary(form, nodal_cfg) == "1R (2/?)"
 
-    def test_empty_form(self):
-        assert build_nodal_summary({}) == ""
+    def test_empty_form(self, nodal_cfg: OrganConfig):
+        assert build_nodal_summary({}, nodal_cfg) == ""
 
-    def test_skips_zero_positive(self):
+    def test_skips_zero_positive(self, nodal_cfg: OrganConfig):
         form = {"LN1R_positive": "", "LN1R_total": "5"}
-        assert build_nodal_summary(form) == ""
+        assert build_nodal_summary(form, nodal_cfg) == ""
+
+    def test_ignores_unconfigured_station(self, nodal_cfg: OrganConfig):
+        form = {"LN99_positive": "1", "LN99_total": "2"}
+        assert build_nodal_summary(form, nodal_cfg) == ""
+
+    def test_no_nodal_field(self, no_mix_cfg: OrganConfig):
+        assert build_nodal_summary({"LN1R_positive": "2"}, no_mix_cfg) == ""
 
 
 # ===================================================================
@@ -288,6 +449,36 @@ class TestExtractFields:
         data = extract_fields(form, mini_cfg)
         assert data["toppings"] == ["A", "C"]
 
+    def test_field_plan_kinds(self, mini_cfg: OrganConfig):
+        assert mini_cfg.field_plan == (
+            ("color", app_module.FIELD_SCALAR),
+            ("size", app_module.FIELD_NUMBER),
+            ("flag", app_module.FIELD_CHECKBOX_BOOL),
+            ("toppings", app_module.FIELD_CHECKBOX_MULTI),
+            ("note", app_module.FIELD_SCALAR),
+        )
+
+    def test_keys_follow_config_order(self, mini_cfg: OrganConfig):
+        data = extract_fields({}, mini_cfg)
+        assert list(data) == ["color", "size", "flag", "toppings", "note", "version"]
+
+    def test_version_from_config(self, mini_cfg: OrganConfig):
+        assert extract_fields({"version": "posted"}, mini_cfg)["version"] == "v1"
+
+    def test_no_version_when_config_has_none(self):
+        cfg = OrganConfig(
+            organ="q", display_name="q", version="", template="dummy.j2", stage_table={},
+            sections=[{"id": "s", "fields": [{"name": "x", "type": "radio"}]}],
+        )
+        assert extract_fields({}, cfg) == {"x": None}
+
+    def test_field_name_needing_quotes(self):
+        cfg = OrganConfig(
+            organ="q", display_name="q", version="", template="dummy.j2", stage_table={},
+            sections=[{"id": "s", "fields": [{"name": "it's \"odd\"", "type": "number"}]}],
+        )
+        assert extract_fields({"it's \"odd\"": "7"}, cfg) == {"it's \"odd\"": 7.0}
+
 
 # ===================================================================
 # 5. Helpers
@@ -308,6 +499,14 @@ class TestNormalizeTnmComponent:
     def test_whitespace(self):
         assert normalize_tnm_component("  pN2a  ") == "N2a"
 
+    @pytest.mark.parametrize("val, expected", [("cT2a", "T2a"), ("yN1", "N1"), ("rM0", "M0")])
+    def test_strip_other_descriptors(self, val, expected):
+        assert normalize_tnm_component(val) == expected
+
+    @pytest.mark.parametrize("val", ["pl1", "pm0", "p", "T1p"])
+    def test_prefix_kept_without_tnm_category(self, val):
+        assert normalize_tnm_component(val) == val
+
 
 class TestToBool:
     @pytest.mark.parametrize("val", ["on", "true", "1", "yes", "True", "ON", "YES"])
@@ -318,6 +517,10 @@ class TestToBool:
     def test_falsy(self, val):
         assert to_bool(val) is False
 
+    @pytest.mark.parametrize("val, expected", [(True, True), (1, True), (False, False), (0, False), (2, False)])
+    def test_non_str(self, val, expected):
+        assert to_bool(val) is expected
+
 
 class TestToFloatOrNone:
     def test_valid_float(self):
@@ -338,6 +541,12 @@ class TestToFloatOrNone:
     def test_empty_list(self):
         assert to_float_or_none([]) is None
 
+    def test_list_uses_first_value(self):
+        assert to_float_or_none(["7", "8"]) == 7.0
+
+    def test_zero(self):
+        assert to_float_or_none(0) == 0.0
+
 
 class TestGetlist:
     def test_dict_with_list(self):
@@ -366,10 +575,45 @@ class TestGetlist:
         form = FakeForm({"k": ["x", "y"]})
         assert getlist(form, "k") == ["x", "y"]
 
+    def test_supports_getlist_non_str_values(self):
+        class FakeForm:
+            def getlist(self, key):
+                return ["a", 3, None, ""]
+
+        assert getlist(FakeForm(), "k") == ["a", "3"]
+
     def test_filters_none_and_empty(self):
         assert getlist({"k": ["a", None, "", "b"]}, "k") == ["a", "b"]
 
 
+class TestIndexedForm:
+    ITEMS = [("k", "a"), ("other", "x"), ("k", ""), ("k", "b")]
+
+    def test_get_returns_last_value(self):
+        assert IndexedForm(self.ITEMS).get("k") == "b"
+
+    def test_get_missing_default(self):
+        assert IndexedForm(self.ITEMS).get("nope", "d") == "d"
+
+    def test_len_counts_distinct_keys(self):
+        assert len(IndexedForm(self.ITEMS)) == 2
+        assert not IndexedForm([])
+
+    def test_getlist_keeps_post_order(self):
+        assert IndexedForm(self.ITEMS).getlist("k") == ["a", "", "b"]
+
+    def test_getlist_helper_drops_empties(self):
+        assert getlist(IndexedForm(self.ITEMS), "k") == ["a", "b"]
+
+    def test_empty_form_summaries(self, mix_cfg: OrganConfig, nodal_cfg: OrganConfig):
+        assert build_histologic_summary(IndexedForm([]), mix_cfg) == ""
+        assert build_nodal_summary(IndexedForm([]), nodal_cfg) == ""
+
+    def test_nodal_summary_first_nonempty(self, nodal_cfg: OrganConfig):
+        form = IndexedForm([("LN1R_positive", ""), ("LN1R_positive", "2"), ("LN1R_total", "5")])
+        assert build_nodal_summary(form, nodal_cfg) == "1R (2/5)"
+
+
 class TestParsePct:
     def test_numeric(self):
         assert parse_pct("60") == 60.0
@@ -386,22 +630,200 @@ class TestParsePct:
     def test_float_string(self):
         assert parse_pct("33.3") == pytest.approx(33.3)
 
+    @pytest.mark.parametrize("val", ["  ", [], "5%", "inf", "-inf", "nan", "1e400"])
+    def test_unparseable_is_zero(self, val):
+        assert parse_pct(val) == 0.0
+
+    def test_surrounding_whitespace(self):
+        assert parse_pct(" 40 ") == 40.0
+
 
 class TestPickPrimaryRow:
+    """Primary-row selection happens inside _collect_histology_rows."""
+
+    @staticmethod
+    def _primary(form, max_rows=4):
+        rows, idx = _collect_histology_rows(form, histology_row_keys(max_rows))
+        return rows[idx]  # (type_code, subtype_code, pct)
+
     def test_highest_pct(self):
-        rows = [
-            {"type_code": "A", "subtype_code": "s1", "pct": 30},
-            {"type_code": "A", "subtype_code": "s2", "pct": 70},
-        ]
-        assert _pick_primary_row(rows)["pct"] == 70
+        form = {
+            "histologic_type_1": "A", "histologic_subtype_1": "s1", "histologic_percent_1": "30",
+            "histologic_type_2": "A", "histologic_subtype_2": "s2", "histologic_percent_2": "70",
+        }
+        assert self._primary(form)[2] == 70
 
     def test_tie_broken_by_subtype(self):
-        rows = [
-            {"type_code": "A", "subtype_code": "", "pct": 50},
-            {"type_code": "A", "subtype_code": "s1", "pct": 50},
-        ]
-        assert _pick_primary_row(rows)["subtype_code"] == "s1"
+        form = {
+            "histologic_type_1": "A", "histologic_subtype_1": "", "histologic_percent_1": "50",
+            "histologic_type_2": "A", "histologic_subtype_2": "s1", "histologic_percent_2": "50",
+        }
+        assert self._primary(form)[1] == "s1"
+
+    def test_full_tie_keeps_first_row(self):
+        form = {
+            "histologic_type_1": "A", "histologic_subtype_1": "s1", "histologic_percent_1": "50",
+            "histologic_type_2": "B", "histologic_subtype_2": "s2", "histologic_percent_2": "50",
+        }
+        assert self._primary(form)[0] == "A"
 
     def test_single_row(self):
-        rows = [{"type_code": "X", "subtype_code": "y", "pct": 100}]
-        assert _pick_primary_row(rows)["type_code"] == "X"
+        form = {"histologic_type_1": "X", "histologic_subtype_1": "y", "histologic_percent_1": "100"}
+        assert self._primary(form)[0] == "X"
+
+    def test_no_rows(self):
+        assert _collect_histology_rows({"histologic_type_1": ""}, histology_row_keys(4)) == ([], -1)
+
+
+class TestLoadCached:
+    @pytest.fixture(autouse=True)
+    def _cache_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "CONFIG_CACHE_DIR", tmp_path / "cache")
+
+    def test_parses_and_writes_snapshot(self, tmp_path):
+        src = tmp_path / "x.yaml"
+        src.write_text("a: 1\n", encoding="utf-8")
+        assert _load_cached(src) == {"a": 1}
+        assert app_module._snapshot_path(src).exists()
+
+    def test_reuses_snapshot(self, tmp_path, monkeypatch):
+        src = tmp_path / "x.yaml"
+        src.write_text("a: 1\n", encoding="utf-8")
+        _load_cached(src)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("YAML parsed despite fresh snapshot")
+
+        monkeypatch.setattr(app_module.yaml, "load", fail)
+        assert _load_cached(src) == {"a": 1}
+
+    def test_invalidated_when_source_changes(self, tmp_path):
+        src = tmp_path / "x.yaml"
+        src.write_text("a: 1\n", encoding="utf-8")
+        _load_cached(src)
+        src.write_text("a: 22\n", encoding="utf-8")
+        st = src.stat()
+        os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert _load_cached(src) == {"a": 22}
+
+    def test_corrupt_snapshot_falls_back_to_yaml(self, tmp_path):
+        src = tmp_path / "x.yaml"
+        src.write_text("a: 1\n", encoding="utf-8")
+        (tmp_path / "cache").mkdir()
+        app_module._snapshot_path(src).write_bytes(b"garbage")
+        assert _load_cached(src) == {"a": 1}
+
+    def test_same_name_in_other_dir_has_own_snapshot(self, tmp_path):
+        src = tmp_path / "x.yaml"
+        other = tmp_path / "tables" / "x.yaml"
+        other.parent.mkdir()
+        src.write_text("a: 1\n", encoding="utf-8")
+        other.write_text("b: 2\n", encoding="utf-8")
+        _load_cached(src)
+        _load_cached(other)
+        assert app_module._snapshot_path(src) != app_module._snapshot_path(other)
+        assert app_module._snapshot_path(src).exists()
+        assert app_module._snapshot_path(other).exists()
+
+    def test_failed_write_leaves_no_temp_file(self, tmp_path, monkeypatch):
+        src = tmp_path / "x.yaml"
+        src.write_text("a: 1\n", encoding="utf-8")
+
+        def fail(*args, **kwargs):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(app_module.os, "replace", fail)
+        assert _load_cached(src) == {"a": 1}
+        assert list((tmp_path / "cache").iterdir()) == []
+
+
+class TestFromDict:
+    @staticmethod
+    def _cfg(tnm):
+        return {"organ": "x", "sections": [], "template": "x.j2", "tnm_stage_table": tnm}
+
+    def test_inline_stage_table(self):
+        oc = OrganConfig.from_dict(self._cfg({"T1a,N0,M0": "Stage IA1"}))
+        assert derive_stage(oc, "T1a", "N0", "M0") == "Stage IA1"
+
+    def test_json_stage_table(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "CONFIG_DIR", tmp_path)
+        (tmp_path / "stages.json").write_text('{"T1a,N0,M0": "Stage IA1"}', encoding="utf-8")
+        oc = OrganConfig.from_dict(self._cfg("stages.json"))
+        assert oc.stage_table == {"T1a,N0,M0": "Stage IA1"}
+
+    def test_yaml_stage_table(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "CONFIG_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "CONFIG_CACHE_DIR", tmp_path / "cache")
+        (tmp_path / "stages.yaml").write_text('"T*,N*,M1a": "Stage IVA"\n', encoding="utf-8")
+        oc = OrganConfig.from_dict(self._cfg("stages.yaml"))
+        assert derive_stage(oc, "T2", "N1", "M1a") == "Stage IVA"
+
+    def test_missing_required_key(self):
+        with pytest.raises(ValueError):
+            OrganConfig.from_dict({"organ": "x", "sections": []})
+
+    def test_unbound_report_template_falls_back_to_env(self):
+        oc = OrganConfig.from_dict({"organ": "x", "sections": [], "template": "lung_report.j2"})
+        assert oc.report_template is None
+        assert app_module._report_template(oc).name == "lung_report.j2"
+
+
+class TestLazyConfigs:
+    @pytest.fixture()
+    def config_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "CONFIG_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "CONFIG_CACHE_DIR", tmp_path / "cache")
+        (tmp_path / "a_organ.yaml").write_text(
+            "organ: a_organ\ndisplay_name: A\nsections: []\ntemplate: lung_report.j2\n", encoding="utf-8"
+        )
+        return tmp_path
+
+    def test_get_reads_only_requested_file(self, config_dir):
+        (config_dir / "broken.yaml").write_text("organ: broken\n", encoding="utf-8")  # no template
+        configs = app_module.LazyConfigs()
+        assert configs.get("a_organ").display_name == "A"
+
+    def test_file_name_differs_from_organ_key(self, config_dir):
+        (config_dir / "other.yaml").write_text(
+            "organ: b_organ\nsections: []\ntemplate: lung_report.j2\n", encoding="utf-8"
+        )
+        assert app_module.LazyConfigs()["b_organ"].organ == "b_organ"
+
+    def test_unknown_organ(self, config_dir):
+        configs = app_module.LazyConfigs()
+        assert configs.get("nope") is None
+        assert "nope" not in configs
+        with pytest.raises(KeyError):
+            configs["nope"]
+
+    def test_items_loads_everything(self, config_dir):
+        (config_dir / "b_organ.yaml").write_text(
+            "organ: b_organ\nsections: []\ntemplate: lung_report.j2\n", encoding="utf-8"
+        )
+        configs = app_module.LazyConfigs()
+        first = configs["a_organ"]
+        assert [k for k, _ in configs.items()] == ["a_organ", "b_organ"]
+        assert configs["a_organ"] is first
+
+    def test_items_sorted_regardless_of_first_request(self, config_dir, monkeypatch):
+        (config_dir / "b_organ.yaml").write_text(
+            "organ: b_organ\nsections: []\ntemplate: lung_report.j2\n", encoding="utf-8"
+        )
+        loaded = []
+        real_load = app_module._load_config
+        monkeypatch.setattr(app_module, "_load_config", lambda path: loaded.append(path.name) or real_load(path))
+
+        configs = app_module.LazyConfigs()
+        first = configs["b_organ"]
+        assert [k for k, _ in configs.items()] == ["a_organ", "b_organ"]
+        assert configs["b_organ"] is first
+        assert sorted(loaded) == ["a_organ.yaml", "b_organ.yaml"]  # b_organ.yaml parsed once
+
+    def test_items_empty_config_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "CONFIG_DIR", tmp_path)
+        assert list(app_module.LazyConfigs().items()) == []
+
+    def test_report_template_bound(self, lung_cfg: OrganConfig):
+        assert lung_cfg.report_template is not None
+        assert lung_cfg.report_template.name == lung_cfg.template